@@ -8,27 +8,49 @@ Usage:
 """
 
 import argparse
+import asyncio
+import functools
+import gc
 import os
 import re
 import sys
 import time
-from datetime import time as dt_time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 
-import requests
-from bs4 import BeautifulSoup
+import aiohttp
 from dotenv import load_dotenv
+from selectolax.lexbor import LexborHTMLParser
 
 BASE_URL = "https://web.csulb.edu/depts/enrollment/registration/class_schedule/Spring_2026/By_Subject/"
 SEMESTER = "Spring 2026"
-BATCH_SIZE = 200
-REQUEST_DELAY = 1.0  # seconds between page fetches
+BATCH_SIZE = 2000
+MAX_INFLIGHT_INSERTS = 2  # schedule batches allowed on the wire while the next one is built
+CONCURRENCY = 10  # max subject pages in flight at once
+REQUESTS_PER_SECOND = 5  # polite request rate to the schedule site (bursts up to this many)
+REQUEST_TIMEOUT = 30  # seconds before a page fetch is abandoned
+CONNECT_TIMEOUT = 5  # seconds to open a connection before giving up on it
+FETCH_RETRIES = 3  # extra attempts for a page after a network error or 5xx
+RETRY_BACKOFF = 0.5  # seconds before the first retry, doubled after each failure
+# Schedule pages are plain HTML and compress well; aiohttp decodes these transparently
+# (br needs the Brotli package from aiohttp[speedups])
+HTTP_HEADERS = {"Accept-Encoding": "gzip, deflate, br", "User-Agent": "beach-rooms-scraper/1.0"}
+# Errors meaning a schedule batch was rejected for its size and nothing was written:
+# 413 Payload Too Large from the gateway, 57014 Postgres statement timeout
+BATCH_TOO_LARGE_CODES = frozenset({"413", "57014"})
+PARSE_WORKERS = os.cpu_count() or 4  # processes parsing subject pages in parallel
 DEFAULT_CAPACITY = 30  # schedule pages don't include room capacity
+# Unique key of class_schedules; re-runs update matching rows in place
+SCHEDULE_KEY_COLUMNS = "classroom_id,semester,day_of_week,start_time,course_code"
 
 # Locations to skip — not real buildings/classrooms
-SKIP_LOCATIONS = {"ONLINE-ONLY", "OFF-CAMP", "TBA", "NA", ""}
+SKIP_LOCATIONS = frozenset({"ONLINE-ONLY", "OFF-CAMP", "TBA", "NA", ""})
+
+# Day/time values meaning the section has no meeting time
+SKIP_SCHEDULE_VALUES = frozenset({"NA", "TBA", ""})
 
 # Outdoor/athletic venues — not useful as study spaces
-SKIP_BUILDING_CODES = {"CTS", "FLD", "RNG", "SWM"}
+SKIP_BUILDING_CODES = frozenset({"CTS", "FLD", "RNG", "SWM"})
 
 # Day abbreviation -> day_of_week integer (0=Sunday, 6=Saturday)
 DAY_MAP = {
@@ -41,76 +63,79 @@ DAY_MAP = {
     "Sa": 6,
 }
 
+# Compiled once so the per-section parsers skip re's pattern cache lookup
+_TIME_RE = re.compile(r"(\d{1,2})(?::(\d{2}))?-(\d{1,2})(?::(\d{2}))?(AM|PM)")
+_FLOOR_RE = re.compile(r"(\d+)")
+# Two-character days listed first so they win over any single-letter day
+_DAY_RE = re.compile(r"Su|Tu|Th|Sa|M|W|F")
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_days(day_str: str) -> tuple[int, ...]:
+    """Parse day string into a tuple of day_of_week integers.
 
-def parse_days(day_str: str) -> list[int]:
-    """Parse day string into list of day_of_week integers.
+    Results are cached (and immutable) since the same few day strings repeat
+    across thousands of sections.
 
     Examples:
-        "MWF"  -> [1, 3, 5]
-        "TuTh" -> [2, 4]
-        "Sa"   -> [6]
+        "MWF"  -> (1, 3, 5)
+        "TuTh" -> (2, 4)
+        "Sa"   -> (6,)
     """
-    days = []
-    i = 0
-    while i < len(day_str):
-        # Try two-character match first (Tu, Th, Sa, Su)
-        if i + 1 < len(day_str) and day_str[i : i + 2] in DAY_MAP:
-            days.append(DAY_MAP[day_str[i : i + 2]])
-            i += 2
-        elif day_str[i] in DAY_MAP:
-            days.append(DAY_MAP[day_str[i]])
-            i += 1
-        else:
-            raise ValueError(f"Unknown day character at position {i} in '{day_str}'")
-    return days
-
-
-def parse_time_range(time_str: str) -> tuple[dt_time, dt_time]:
-    """Parse a time range string into (start_time, end_time).
+    tokens = _DAY_RE.findall(day_str)
+    # findall silently skips characters it can't match, so make sure nothing was dropped
+    if "".join(tokens) != day_str:
+        raise ValueError(f"Unknown day characters in '{day_str}'")
+    return tuple(DAY_MAP[t] for t in tokens)
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_time_range(time_str: str) -> tuple[str, str]:
+    """Parse a time range string into ("HH:MM:00" start, "HH:MM:00" end).
 
     The AM/PM suffix applies to the end time. The start time's period is
     inferred: assume same period as end, then correct if start >= end.
 
+    Times come back already formatted for the database, so cached results
+    share the same two strings instead of formatting them per row.
+
     Examples:
-        "9-11:45AM"    -> (09:00, 11:45)
-        "2:30-3:45PM"  -> (14:30, 15:45)
-        "11-12:50PM"   -> (11:00, 12:50)
-        "7-9:45PM"     -> (19:00, 21:45)
+        "9-11:45AM"    -> ("09:00:00", "11:45:00")
+        "2:30-3:45PM"  -> ("14:30:00", "15:45:00")
+        "11-12:50PM"   -> ("11:00:00", "12:50:00")
+        "7-9:45PM"     -> ("19:00:00", "21:45:00")
     """
-    match = re.match(
-        r"(\d{1,2})(?::(\d{2}))?-(\d{1,2})(?::(\d{2}))?(AM|PM)", time_str.strip()
-    )
+    match = _TIME_RE.match(time_str.strip())
     if not match:
         raise ValueError(f"Cannot parse time: '{time_str}'")
 
-    start_h = int(match.group(1))
-    start_m = int(match.group(2) or 0)
-    end_h = int(match.group(3))
-    end_m = int(match.group(4) or 0)
-    period = match.group(5)
-
-    # Convert end time to 24h
-    if period == "PM" and end_h != 12:
-        end_h += 12
-    elif period == "AM" and end_h == 12:
-        end_h = 0
+    start_h, start_m = int(match.group(1)), int(match.group(2) or 0)
+    end_h, end_m = int(match.group(3)), int(match.group(4) or 0)
+    if start_h > 12 or end_h > 12 or start_m >= 60 or end_m >= 60:
+        raise ValueError(f"Time out of range: '{time_str}'")
 
-    # Assume start has same period, convert to 24h
-    if period == "PM" and start_h != 12:
-        start_h += 12
-    elif period == "AM" and start_h == 12:
-        start_h = 0
+    # Work in minutes since midnight; % 12 maps 12AM/12PM onto the 0 hour
+    # so PM is just +12h
+    start = start_h % 12 * 60 + start_m
+    end = end_h % 12 * 60 + end_m
+    if match.group(5) == "PM":
+        start += 720
+        end += 720
 
-    # If that makes start >= end, start was actually AM (subtract 12)
-    if start_h > end_h or (start_h == end_h and start_m >= end_m):
-        start_h -= 12
+    # Start assumed the same period as end; if that puts it at or after
+    # the end, start was actually AM (subtract 12h)
+    if start >= end:
+        start -= 720
+    if start < 0:
+        raise ValueError(f"Time out of range: '{time_str}'")
 
-    return dt_time(start_h, start_m), dt_time(end_h, end_m)
+    return f"{start // 60:02d}:{start % 60:02d}:00", f"{end // 60:02d}:{end % 60:02d}:00"
 
 
+@functools.lru_cache(maxsize=256)
 def extract_floor(room_number: str) -> int | None:
     """Infer floor number from room number. '413' -> 4, '051' -> 0."""
-    digits = re.search(r"(\d+)", room_number)
+    digits = _FLOOR_RE.search(room_number)
     if not digits:
         return None
     num = int(digits.group(1))
@@ -119,26 +144,82 @@ def extract_floor(room_number: str) -> int | None:
     return num // 100
 
 
-def get_subject_urls() -> list[str]:
+class RateLimiter:
+    """Token-bucket rate limiter for async requests.
+
+    Holds up to `rate` tokens and refills `rate` tokens per second, so short
+    bursts go out immediately while the sustained rate stays polite.
+    """
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait until a token is available, then take it."""
+        # Waiters queue on the lock so tokens are handed out in order
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+async def fetch(
+    sem: asyncio.Semaphore, limiter: RateLimiter, session: aiohttp.ClientSession, url: str
+) -> str:
+    """Fetch a page, holding a semaphore slot so only CONCURRENCY requests run at once.
+
+    Network errors, timeouts, 429 and 5xx responses are retried with
+    exponential backoff (or the server's Retry-After, if longer). The body is
+    decoded with the response charset, since Lexbor reads bytes as UTF-8
+    regardless of what the page declares.
+    """
+    for attempt in range(FETCH_RETRIES + 1):
+        delay = RETRY_BACKOFF * 2**attempt
+        try:
+            async with sem:
+                await limiter.acquire()
+                async with session.get(url) as resp:
+                    resp.raise_for_status()
+                    return await resp.text(errors="replace")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            status = e.status if isinstance(e, aiohttp.ClientResponseError) else None
+            # Other 4xx won't change on retry; 429 just means slow down
+            client_error = status is not None and status < 500 and status != 429
+            if client_error or attempt == FETCH_RETRIES:
+                raise
+            if isinstance(e, aiohttp.ClientResponseError) and status == 429 and e.headers:
+                retry_after = e.headers.get("Retry-After", "")
+                if retry_after.isdigit():
+                    delay = max(delay, int(retry_after))
+        # Back off outside the semaphore so other pages keep downloading
+        await asyncio.sleep(delay)
+    raise AssertionError("unreachable: the last attempt returns or raises")
+
+
+async def get_subject_urls(
+    sem: asyncio.Semaphore, limiter: RateLimiter, session: aiohttp.ClientSession
+) -> list[str]:
     """Parse the main schedule page and grab all of the subject URLs"""
-    resp = requests.get(BASE_URL + "index.html")
-    resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, "html.parser")
-
-    urls = []
-    seen = set()
-    for a in soup.find_all("a", href=True):
-        href = a["href"]
-        # Only include subject pages (e.g., CECS.html), skip index and non-subject links
-        if (
-            href.endswith(".html")
-            and href != "index.html"
-            and "/" not in href  # Exclude paths like ../By_College/index.html
-            and href not in seen
-        ):
-            seen.add(href)
-            urls.append(BASE_URL + href)
-    return urls
+    html = await fetch(sem, limiter, session, BASE_URL + "index.html")
+    tree = LexborHTMLParser(html)
+
+    # Only include subject pages (e.g., CECS.html), skip index and non-subject links
+    # like ../By_College/index.html
+    hrefs = [
+        h
+        for a in tree.css('a[href$=".html"]')
+        if (h := a.attributes.get("href")) and h != "index.html" and "/" not in h
+    ]
+    # dict.fromkeys de-dups while keeping page order
+    return [BASE_URL + h for h in dict.fromkeys(hrefs)]
 
 
 def parse_subject_page(html: str) -> list[dict]:
@@ -151,180 +232,320 @@ def parse_subject_page(html: str) -> list[dict]:
     - location: "ECS-413"
     - instructor: "Dr. Smith"
     """
-    soup = BeautifulSoup(html, "html.parser") # take the html and convert it to a tree structure that we can navigate and search
+    tree = LexborHTMLParser(html) # take the html and convert it to a tree structure that we can query with CSS selectors
     sections = []
 
-    for course_block in soup.find_all("div", class_="courseBlock"):
-        h4 = course_block.find("h4")
+    for course_block in tree.css("div.courseBlock"):
+        h4 = course_block.css_first("h4")
         if not h4:
             continue
 
-        code_span = h4.find("span", class_="courseCode")
-        title_span = h4.find("span", class_="courseTitle")
-        course_code = code_span.get_text(strip=True) if code_span else ""
-        course_title = title_span.get_text(strip=True) if title_span else ""
+        code_span = h4.css_first("span.courseCode")
+        title_span = h4.css_first("span.courseTitle")
+        course_code = code_span.text(strip=True) if code_span else ""
+        course_title = title_span.text(strip=True) if title_span else ""
 
         # A course can have multiple tables (one per group)
-        for table in course_block.find_all("table", class_="sectionTable"):
-            for row in table.find_all("tr"):
-                cells = row.find_all(["td", "th"])
+        for row in course_block.css("table.sectionTable tr"):
+            cells = row.css("td, th")
 
-                # Skip header rows (all <th scope="col">)
-                if cells and cells[0].get("scope") == "col":
-                    continue
+            # Skip header rows (all <th scope="col">)
+            if cells and cells[0].attributes.get("scope") == "col":
+                continue
 
-                # Data rows have 12 cells: 1 th(scope=row) + 11 td
-                if len(cells) < 12:
-                    continue
+            # Data rows have 12 cells: 1 th(scope=row) + 11 td
+            if len(cells) < 12:
+                continue
+
+            days_text = cells[6].text(strip=True)
+            time_text = cells[7].text(strip=True)
+            location = cells[9].text(strip=True)
+            instructor = cells[10].text(strip=True)
 
-                days_text = cells[6].get_text(strip=True)
-                time_text = cells[7].get_text(strip=True)
-                location = cells[9].get_text(strip=True)
-                instructor = cells[10].get_text(strip=True)
-
-                sections.append(
-                    {
-                        "course_code": course_code,
-                        "course_title": course_title,
-                        "days": days_text,
-                        "time": time_text,
-                        "location": location,
-                        "instructor": instructor,
-                    }
-                )
+            sections.append(
+                {
+                    "course_code": course_code,
+                    "course_title": course_title,
+                    "days": days_text,
+                    "time": time_text,
+                    "location": location,
+                    "instructor": instructor,
+                }
+            )
     return sections
 
 
-def process_sections(supabase_client, sections: list[dict], dry_run: bool = False) -> tuple[int, int]:
+def select_all(supabase_client, table: str, columns: str) -> list[dict]:
+    """Select every row of a table, paging past Supabase's 1000-row response cap."""
+    rows = []
+    page_size = 1000
+    offset = 0
+    while True:
+        batch = (
+            supabase_client.table(table)
+            .select(columns)
+            .order("id")
+            .range(offset, offset + page_size - 1)
+            .execute()
+        )
+        rows.extend(batch.data)
+        if len(batch.data) < page_size:
+            break
+        offset += page_size
+    return rows
+
+
+def upsert_locations(
+    supabase_client, locations: dict[str, tuple[str, str]]
+) -> tuple[dict[str, str], dict[str, str]]:
+    """
+    Make sure every building and classroom exists and return their ids.
+
+    `locations` maps each location string to its parts, e.g.
+    "ECS-413" -> ("ECS", "413").
+
+    Existing rows are preloaded with one select per table; only buildings and
+    classrooms not seen before are upserted, in one request per table.
+
+    Returns (buildings_cache, classrooms_cache) mapping code -> uuid and
+    location ("ECS-413") -> uuid.
+    """
+    buildings_cache = {
+        b["code"]: b["id"] for b in select_all(supabase_client, "buildings", "id,code")
+    }
+
+    # Upsert new buildings (only code - name/coords added manually in Supabase)
+    new_codes = {code for code, _ in locations.values()} - buildings_cache.keys()
+    if new_codes:
+        result = supabase_client.table("buildings").upsert(
+            [{"code": code} for code in new_codes],
+            on_conflict="code",
+            returning="representation",
+        ).execute()
+        buildings_cache.update({b["code"]: b["id"] for b in result.data})
+
+    # Key classrooms by the same "CODE-ROOM" string the schedule pages use
+    code_by_building_id = {bid: code for code, bid in buildings_cache.items()}
+    classrooms_cache = {
+        f"{code_by_building_id[c['building_id']]}-{c['room_number']}": c["id"]
+        for c in select_all(supabase_client, "classrooms", "id,building_id,room_number")
+    }
+
+    # Upsert new classrooms
+    new_rooms = locations.keys() - classrooms_cache.keys()
+    if new_rooms:
+        result = supabase_client.table("classrooms").upsert(
+            [
+                {
+                    "building_id": buildings_cache[code],
+                    "room_number": room,
+                    "capacity": DEFAULT_CAPACITY,
+                    "floor": extract_floor(room),
+                }
+                for code, room in (locations[loc] for loc in new_rooms)
+            ],
+            on_conflict="building_id,room_number",
+            returning="representation",
+        ).execute()
+        classrooms_cache.update(
+            {
+                f"{code_by_building_id[c['building_id']]}-{c['room_number']}": c["id"]
+                for c in result.data
+            }
+        )
+
+    print(f"  Added {len(new_codes)} new buildings, {len(new_rooms)} new classrooms")
+    return buildings_cache, classrooms_cache
+
+
+def upsert_schedules(supabase_client, batch: list[dict]):
+    """Upsert one batch of class_schedules rows on SCHEDULE_KEY_COLUMNS.
+
+    If the batch is rejected as too large, it is split in half and each half
+    retried, so a generous BATCH_SIZE can't fail the whole run.
+    """
+    # Imported here like create_client, so dry runs don't need the Supabase stack
+    from postgrest.exceptions import APIError
+
+    try:
+        # The upserted rows aren't needed, so don't have PostgREST send them back
+        supabase_client.table("class_schedules").upsert(
+            batch, on_conflict=SCHEDULE_KEY_COLUMNS, returning="minimal"
+        ).execute()
+    except APIError as e:
+        if len(batch) <= 1 or str(e.code) not in BATCH_TOO_LARGE_CODES:
+            raise
+        mid = len(batch) // 2
+        print(f"  WARN: batch of {len(batch)} rejected ({e.code}), retrying as {mid} + {len(batch) - mid}")
+        upsert_schedules(supabase_client, batch[:mid])
+        upsert_schedules(supabase_client, batch[mid:])
+
+
+def delete_stale_schedules(supabase_client, run_id: str) -> int:
+    """Delete this semester's schedules that weren't upserted by run_id.
+
+    Returns the number of rows deleted.
+    """
+    result = supabase_client.rpc(
+        "delete_stale_schedules", {"p_semester": SEMESTER, "p_run_id": run_id}
+    ).execute()
+    return result.data
+
+
+def process_sections(
+    supabase_client, sections: list[dict], dry_run: bool = False, prune_stale: bool = True
+) -> tuple[int, int, int, int]:
     """
-    LAST STEP: Process the parsed sections and insert them into the database.
+    LAST STEP: Process the parsed sections and upsert them into the database.
 
-    Returns (inserted_count, skipped_count).
+    With prune_stale, rows for SEMESTER that this run didn't produce are
+    deleted afterwards. Pass False when the scrape was incomplete.
+
+    Returns (inserted_count, skipped_count, building_count, classroom_count),
+    the last two counting distinct buildings/classrooms used (dry run or not).
     """
-    buildings_cache: dict[str, str] = {}  # code -> uuid
-    classrooms_cache: dict[tuple[str, str], str] = {}  # (code, room) -> uuid
-    schedule_batch: list[dict] = []
+    valid_sections: list[tuple[dict, str]] = []  # (section, location)
+    locations: dict[str, tuple[str, str]] = {}  # "ECS-413" -> ("ECS", "413")
+    # Rows are (classroom_id, day, start, end, course_code, course_title, instructor)
+    # tuples; dicts are only built when a batch is flushed
+    schedule_batch: list[tuple] = []
+    seen: set[tuple] = set()  # natural keys of rows already batched
+    # Stamped on every upserted row; anything left without it is stale
+    run_id = str(uuid.uuid4())
     inserted_count = 0
     skipped_count = 0
 
+    # First pass: filter sections and collect every building/classroom they use
     for section in sections:
-        location = section["location"]
-        days_str = section["days"]
-        time_str = section["time"]
+        location = section["location"].strip()
 
         # Skip non-physical locations
-        if location.upper() in SKIP_LOCATIONS or not location.strip():
+        if not location or location.upper() in SKIP_LOCATIONS:
             skipped_count += 1
             continue
 
         # Skip rows with no schedule (NA, TBA, empty)
-        if days_str in ("NA", "TBA", "") or time_str in ("NA", "TBA", ""):
+        if section["days"] in SKIP_SCHEDULE_VALUES or section["time"] in SKIP_SCHEDULE_VALUES:
             skipped_count += 1
             continue
 
         # Parse location: "ECS-413" -> ("ECS", "413")
-        if "-" not in location:
+        building_code, sep, room_number = location.partition("-")
+        if not sep:
             print(f"  WARN: unusual location format: {location}")
             skipped_count += 1
             continue
 
-        building_code, room_number = location.split("-", 1)
-
         # Skip outdoor/athletic venues
         if building_code in SKIP_BUILDING_CODES:
             skipped_count += 1
             continue
 
-        if dry_run:
-            # Still validate parsing works
-            try:
-                parse_days(days_str)
-                parse_time_range(time_str)
-            except ValueError as e:
-                print(f"  WARN: parse error: {e} (section: {section})")
-                skipped_count += 1
-                continue
-
-            # Count what would be inserted
-            day_count = len(parse_days(days_str))
-            inserted_count += day_count
-            # Track buildings/classrooms for stats
-            buildings_cache[building_code] = "dry-run"
-            classrooms_cache[(building_code, room_number)] = "dry-run"
-            continue
+        valid_sections.append((section, location))
+        if location not in locations:
+            locations[location] = (building_code, room_number)
 
-        # --- Database writes below ---
-
-        # Upsert building (only code - name/coords added manually in Supabase)
-        if building_code not in buildings_cache:
-            result = (
-                supabase_client.table("buildings")
-                .upsert(
-                    {"code": building_code},
-                    on_conflict="code",
-                )
-                .execute()
-            )
-            buildings_cache[building_code] = result.data[0]["id"]
-
-        building_id = buildings_cache[building_code]
-
-        # Upsert classroom
-        cache_key = (building_code, room_number)
-        if cache_key not in classrooms_cache:
-            floor_num = extract_floor(room_number)
-            result = (
-                supabase_client.table("classrooms")
-                .upsert(
-                    {
-                        "building_id": building_id,
-                        "room_number": room_number,
-                        "capacity": DEFAULT_CAPACITY,
-                        "floor": floor_num,
-                    },
-                    on_conflict="building_id,room_number",
-                )
-                .execute()
-            )
-            classrooms_cache[cache_key] = result.data[0]["id"]
+    # --- Database writes below ---
 
-        classroom_id = classrooms_cache[cache_key]
+    classrooms_cache: dict[str, str] = {}  # location -> uuid
+    if locations and not dry_run:
+        _, classrooms_cache = upsert_locations(supabase_client, locations)
 
-        # Parse days and time
-        try:
-            day_indices = parse_days(days_str)
-            start_time, end_time = parse_time_range(time_str)
-        except ValueError as e:
-            print(f"  WARN: parse error: {e} (section: {section})")
-            skipped_count += 1
-            continue
+    # Second pass: parse days/times and build the schedule rows.
+    # Full batches are upserted on a background thread so the network
+    # round-trip overlaps with building the next batch.
+    with ThreadPoolExecutor(max_workers=MAX_INFLIGHT_INSERTS) as pool:
+        pending: list[Future] = []
 
-        # Add schedule rows to batch (one per day)
-        for day in day_indices:
-            schedule_batch.append(
+        def flush(batch: list[tuple]):
+            rows = [
                 {
                     "classroom_id": classroom_id,
                     "semester": SEMESTER,
                     "day_of_week": day,
-                    "start_time": start_time.isoformat(),
-                    "end_time": end_time.isoformat(),
-                    "course_code": section["course_code"],
-                    "course_title": section["course_title"],
-                    "instructor_name": section["instructor"],
+                    "start_time": start,
+                    "end_time": end,
+                    "course_code": course_code,
+                    "course_title": course_title,
+                    "instructor_name": instructor,
+                    "scrape_run_id": run_id,
                 }
-            )
-            inserted_count += 1
-
-        # Flush batch when it's full
-        if len(schedule_batch) >= BATCH_SIZE:
-            supabase_client.table("class_schedules").insert(schedule_batch).execute()
-            schedule_batch = []
-
-    # Flush remaining batch
-    if schedule_batch and not dry_run:
-        supabase_client.table("class_schedules").insert(schedule_batch).execute()
+                for classroom_id, day, start, end, course_code, course_title, instructor in batch
+            ]
+            # Wait for the oldest upsert if too many are already in flight
+            if len(pending) >= MAX_INFLIGHT_INSERTS:
+                pending.pop(0).result()
+            pending.append(pool.submit(upsert_schedules, supabase_client, rows))
+
+        # The loop creates tens of thousands of row tuples and keys that stay
+        # alive in `seen` and the batches, so young-generation passes keep
+        # re-scanning live objects without freeing any. The pause is
+        # process-wide, so cyclic garbage from the upsert threads (HTTP
+        # client internals, retry tracebacks) waits for the collect below.
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for section, location in valid_sections:
+                try:
+                    day_indices = parse_days(section["days"])
+                    start_time, end_time = parse_time_range(section["time"])
+                except ValueError as e:
+                    print(f"  WARN: parse error: {e} (section: {section})")
+                    skipped_count += 1
+                    continue
 
-    return inserted_count, skipped_count
+                classroom_id = None if dry_run else classrooms_cache[location]
+
+                # Add schedule rows to batch (one per day)
+                for day in day_indices:
+                    # The same meeting can be listed more than once; only send it once.
+                    # Matches SCHEDULE_KEY_COLUMNS so one batch never hits a key twice.
+                    key = (location, day, start_time, section["course_code"])
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    inserted_count += 1
+
+                    if dry_run:
+                        # Only count what would be inserted
+                        continue
+
+                    schedule_batch.append(
+                        (
+                            classroom_id,
+                            day,
+                            start_time,
+                            end_time,
+                            section["course_code"],
+                            section["course_title"],
+                            section["instructor"],
+                        )
+                    )
+
+                # Flush batch when it's full
+                if len(schedule_batch) >= BATCH_SIZE:
+                    flush(schedule_batch)
+                    schedule_batch = []
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+                gc.collect()
+
+        # Flush remaining batch
+        if schedule_batch and not dry_run:
+            flush(schedule_batch)
+
+        # Surface any upsert errors
+        for future in pending:
+            future.result()
+
+    # Only prune once every batch has landed, and never on an empty run
+    if prune_stale and inserted_count and not dry_run:
+        deleted = delete_stale_schedules(supabase_client, run_id)
+        print(f"  Deleted {deleted} stale schedule rows")
+
+    building_count = len({code for code, _ in locations.values()})
+    return inserted_count, skipped_count, building_count, len(locations)
 
 
 def calculate_building_hours(supabase_client):
@@ -336,60 +557,88 @@ def calculate_building_hours(supabase_client):
 
     print("\nCalculating building hours from class schedules...")
 
-    # Get all classrooms with their building_id
-    classrooms = supabase_client.table("classrooms").select("id, building_id").limit(10000).execute()
-    classroom_to_building = {c["id"]: c["building_id"] for c in classrooms.data}
-    print(f"  Found {len(classrooms.data)} classrooms")
-
-    # Get all schedules using pagination (Supabase has 1000 row max per request)
-    all_schedules = []
-    page_size = 1000
-    offset = 0
-    while True:
-        batch = supabase_client.table("class_schedules").select("*").range(offset, offset + page_size - 1).execute()
-        all_schedules.extend(batch.data)
-        if len(batch.data) < page_size:
-            break
-        offset += page_size
-    print(f"  Found {len(all_schedules)} schedules")
-
-    # Group weekday schedules by building (days 1-5 are Mon-Fri)
-    building_hours = {}  # {building_id: {min, max}}
-
-    for schedule in all_schedules:
-        building_id = classroom_to_building.get(schedule["classroom_id"])
-        if not building_id:
-            continue
-
-        day = schedule["day_of_week"]
-        # Skip weekends (0=Sunday, 6=Saturday)
-        if day == 0 or day == 6:
-            continue
-
-        if building_id not in building_hours:
-            building_hours[building_id] = {"min": None, "max": None}
-
-        start = schedule["start_time"]
-        end = schedule["end_time"]
-
-        hours = building_hours[building_id]
-        if hours["min"] is None or start < hours["min"]:
-            hours["min"] = start
-        if hours["max"] is None or end > hours["max"]:
-            hours["max"] = end
+    # Earliest start / latest end per building (Mon-Fri) is aggregated in
+    # Postgres, so only one row per building comes back
+    rows = supabase_client.rpc("building_weekday_hours", {"p_semester": SEMESTER}).execute().data
 
     # Update buildings table
-    updated_count = 0
-    for building_id, hours in building_hours.items():
-        if hours["min"]:
-            update_data = {
-                "weekday_open": hours["min"],
-                "weekday_close": hours["max"],
-            }
-            supabase_client.table("buildings").update(update_data).eq("id", building_id).execute()
-            updated_count += 1
-
-    print(f"  Updated hours for {updated_count} buildings")
+    if rows:
+        supabase_client.table("buildings").upsert(
+            [
+                {
+                    "id": r["building_id"],
+                    "code": r["code"],
+                    "weekday_open": r["weekday_open"],
+                    "weekday_close": r["weekday_close"],
+                }
+                for r in rows
+            ],
+            on_conflict="id",
+            returning="minimal",
+        ).execute()
+
+    print(f"  Updated hours for {len(rows)} buildings")
+
+
+async def scrape_subject(
+    sem: asyncio.Semaphore,
+    limiter: RateLimiter,
+    session: aiohttp.ClientSession,
+    pool: ProcessPoolExecutor,
+    url: str,
+) -> list[dict]:
+    """Fetch one subject page and parse it in the process pool."""
+    html = await fetch(sem, limiter, session, url)
+    # Parsing is CPU-bound, so hand it to another process and keep downloading
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(pool, parse_subject_page, html)
+
+
+async def scrape_subjects(pool: ProcessPoolExecutor) -> tuple[list[dict], int]:
+    """Fetch the subject index and every subject page concurrently.
+
+    Returns (all_sections, failed_count) where failed_count is the number of
+    subject pages that couldn't be fetched or parsed.
+    """
+    sem = asyncio.Semaphore(CONCURRENCY)
+    limiter = RateLimiter(REQUESTS_PER_SECOND)
+    # One session for every request so TCP+TLS connections are pooled and kept alive
+    connector = aiohttp.TCPConnector(limit=20, limit_per_host=CONCURRENCY, keepalive_timeout=30)
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT, sock_connect=CONNECT_TIMEOUT)
+    async with aiohttp.ClientSession(
+        connector=connector, timeout=timeout, headers=HTTP_HEADERS
+    ) as session:
+        # Fetch all subject URLs from base URL (SEM_2025/By_Subject)
+        print("Fetching subject index...")
+        subject_urls = await get_subject_urls(sem, limiter, session)
+        print(f"Found {len(subject_urls)} subject pages\n")
+
+        failed_count = 0
+        done_count = 0
+
+        async def scrape_and_report(url: str) -> list[dict]:
+            nonlocal failed_count, done_count
+            subject = url.split("/")[-1].replace(".html", "")
+            sections: list[dict] = []
+            try:
+                sections = await scrape_subject(sem, limiter, session, pool, url)
+            except Exception as e:
+                failed_count += 1
+                result = f"ERROR: {e}"
+            else:
+                result = f"{len(sections)} sections"
+            # Report each page as it finishes, so lines come in completion order
+            done_count += 1
+            print(f"  [{done_count}/{len(subject_urls)}] {subject}... {result}")
+            return sections
+
+        # Scrape each subject page, keeping N requests in flight while
+        # finished pages are parsed across cores
+        results = await asyncio.gather(*[scrape_and_report(url) for url in subject_urls])
+
+    # Sections stay in page order, whatever order the pages finished in
+    all_sections = [section for sections in results for section in sections]
+    return all_sections, failed_count
 
 
 def main():
@@ -415,47 +664,34 @@ def main():
 
         supabase_client = create_client(url, key)
 
-        # Clear all existing schedules
-        print(f"Clearing all existing schedules...")
-        supabase_client.table("class_schedules").delete().gte("created_at", "1970-01-01").execute()
-
-    # Fetch all subject URLs from base URL (SEM_2025/By_Subject)
-    print("Fetching subject index...")
-    subject_urls = get_subject_urls()
-    print(f"Found {len(subject_urls)} subject pages\n")
-
-    # Scrape each subject page
-    all_sections: list[dict] = []
-    for i, url in enumerate(subject_urls):
-        subject = url.split("/")[-1].replace(".html", "")
-        print(f"  [{i + 1}/{len(subject_urls)}] {subject}...", end=" ", flush=True)
-        try:
-            resp = requests.get(url)
-            resp.raise_for_status()
-            sections = parse_subject_page(resp.text)
-            all_sections.extend(sections)
-            print(f"{len(sections)} sections")
-        except Exception as e:
-            print(f"ERROR: {e}")
-        time.sleep(REQUEST_DELAY)
+    # Fork the parse workers up front: once aiohttp's resolver threads are
+    # running, forking the process can deadlock
+    with ProcessPoolExecutor(max_workers=PARSE_WORKERS) as pool:
+        pool.submit(int).result()
+        all_sections, failed_count = asyncio.run(scrape_subjects(pool))
 
     print(f"\nParsed {len(all_sections)} total sections")
+    if failed_count and not args.dry_run:
+        # Schedules from missing pages would look stale, so keep existing rows
+        print(f"WARN: {failed_count} subject pages failed; stale schedules will not be deleted")
 
-    mode = "DRY RUN" if args.dry_run else "Inserting"
+    mode = "DRY RUN" if args.dry_run else "Upserting"
     print(f"\n{mode}...")
 
-    # Process the parsed sections and insert them into supabase
-    inserted, skipped = process_sections(
-        supabase_client, all_sections, dry_run=args.dry_run
+    # Process the parsed sections and upsert them into supabase
+    inserted, skipped, building_count, classroom_count = process_sections(
+        supabase_client, all_sections, dry_run=args.dry_run, prune_stale=not failed_count
     )
 
     print(f"\nDone!")
-    print(f"  Schedule rows {'would insert' if args.dry_run else 'inserted'}: {inserted}")
+    print(f"  Schedule rows {'would upsert' if args.dry_run else 'upserted'}: {inserted}")
     print(f"  Sections skipped (online/TBA/unknown): {skipped}")
+    print(f"  Buildings: {building_count}, classrooms: {classroom_count}")
 
-    # Calculate and update building hours from inserted schedules
+    # Calculate and update building hours from upserted schedules
     if not args.dry_run:
         calculate_building_hours(supabase_client)
 
 
-main()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+-- Compute each building's weekday hours (first class start to last class end,
+-- Mon-Fri) in the database so the scraper doesn't have to page every
+-- class_schedules row over HTTP and reduce it client-side.
+-- Returns the building code too so the result can be upserted straight back
+-- into buildings (code is NOT NULL). Only p_semester's rows count, since
+-- other semesters' schedules persist in the table.
+
+CREATE OR REPLACE FUNCTION "public"."building_weekday_hours"("p_semester" "text")
+    RETURNS TABLE (
+      "building_id" "uuid",
+      "code" "text",
+      "weekday_open" time without time zone,
+      "weekday_close" time without time zone
+    )
+    LANGUAGE "sql" STABLE
+    SET search_path = ''
+    AS $$
+  SELECT b.id, b.code, MIN(s.start_time), MAX(s.end_time)
+  FROM public.class_schedules s
+  JOIN public.classrooms c ON c.id = s.classroom_id
+  JOIN public.buildings b ON b.id = c.building_id
+  WHERE s.semester = p_semester
+    AND s.day_of_week BETWEEN 1 AND 5
+  GROUP BY b.id, b.code;
+$$;
+
+ALTER FUNCTION "public"."building_weekday_hours"("text") OWNER TO "postgres";
+
+GRANT ALL ON FUNCTION "public"."building_weekday_hours"("text") TO "service_role";
@@ -0,0 +1,55 @@
+-- Migration: Refresh class_schedules in place instead of delete + insert
+-- The scraper now upserts on a natural key and deletes only the rows that
+-- disappeared from this semester's schedule, so rows are updated in place
+-- and a failed run no longer leaves the table empty.
+
+-- =============================================================================
+-- 1. class_schedules: natural unique key
+-- =============================================================================
+
+-- Drop duplicates left by older scraper runs so the constraint can be added
+DELETE FROM "public"."class_schedules" a
+  USING "public"."class_schedules" b
+  WHERE a."id" > b."id"
+    AND a."classroom_id" = b."classroom_id"
+    AND a."semester" = b."semester"
+    AND a."day_of_week" = b."day_of_week"
+    AND a."start_time" = b."start_time"
+    AND a."course_code" IS NOT DISTINCT FROM b."course_code";
+
+ALTER TABLE ONLY "public"."class_schedules"
+  ADD CONSTRAINT "class_schedules_natural_key"
+  UNIQUE ("classroom_id", "semester", "day_of_week", "start_time", "course_code");
+
+-- Set by the scraper on every row it upserts; rows still carrying an older
+-- run's id weren't on the latest schedule
+ALTER TABLE ONLY "public"."class_schedules"
+  ADD COLUMN "scrape_run_id" "uuid";
+
+-- =============================================================================
+-- 2. delete_stale_schedules: remove rows not produced by the latest scrape
+-- =============================================================================
+
+-- Deletes every row of p_semester that the run p_run_id didn't upsert
+-- (including rows from before scrape_run_id existed). Returns the count.
+CREATE OR REPLACE FUNCTION "public"."delete_stale_schedules"("p_semester" "text", "p_run_id" "uuid")
+    RETURNS integer
+    LANGUAGE "sql" SECURITY DEFINER
+    SET search_path = ''
+    AS $$
+  WITH deleted AS (
+    DELETE FROM public.class_schedules s
+    WHERE s.semester = p_semester
+      AND s.scrape_run_id IS DISTINCT FROM p_run_id
+    RETURNING 1
+  )
+  SELECT count(*)::integer FROM deleted;
+$$;
+
+ALTER FUNCTION "public"."delete_stale_schedules"("text", "uuid") OWNER TO "postgres";
+
+-- Only the scraper (service role) may delete schedules
+REVOKE ALL ON FUNCTION "public"."delete_stale_schedules"("text", "uuid") FROM PUBLIC;
+REVOKE ALL ON FUNCTION "public"."delete_stale_schedules"("text", "uuid") FROM "anon";
+REVOKE ALL ON FUNCTION "public"."delete_stale_schedules"("text", "uuid") FROM "authenticated";
+GRANT ALL ON FUNCTION "public"."delete_stale_schedules"("text", "uuid") TO "service_role";